@@ -1,12 +1,31 @@
 import google.generativeai as genai
-import pandas as pd
 import os
-import json
-import re
+import openpyxl
 import xlsxwriter
 import argparse
 import sys
-from datetime import datetime
+import hashlib
+import shelve
+import time
+import asyncio
+from collections import deque
+from typing_extensions import TypedDict  # typing.TypedDict is rejected by pydantic on Python < 3.12
+from datetime import datetime, timedelta
+from google.generativeai import caching
+from google.api_core import exceptions as google_exceptions
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+# Prefer orjson for faster parsing of Gemini responses, fall back to the standard library
+try:
+    import orjson as json_parser
+except ImportError:
+    import json as json_parser
+
+# Optionally repair malformed JSON (trailing commas, unclosed braces, ...) instead of dropping the response
+try:
+    from json_repair import repair_json
+except ImportError:
+    repair_json = None
 # Configure Gemini API
 
 api_key = os.getenv("GEMINI_API_KEY")
@@ -21,7 +40,7 @@ parser.add_argument("input_file", help="Path to the user stories input file")
 parser.add_argument(
     "output_file",
     nargs="?",
-    default=f"Test_Cases_{datetime.now().strftime('%d%m%Y%H%M%S')}.xlsx",
+    default=None,
     help="Path to the output Excel file (must have .xlsx extension, optional, default: Test_Cases_DDMMYYYYHHmmss.xlsx)"
 )
 parser.add_argument(
@@ -30,8 +49,21 @@ parser.add_argument(
     default=None,
     help="Optional system information text file to improve test case relevance."
 )
+parser.add_argument(
+    "--no-merge",
+    action="store_true",
+    help="Repeat Name, Objective, Precondition, Coverage and Status on every step row instead of merging them (faster and uses less memory for large outputs)."
+)
+parser.add_argument(
+    "--no-cache",
+    action="store_true",
+    help="Always call the Gemini API instead of reusing cached responses for previously seen user stories."
+)
 args = parser.parse_args()
 
+# Name the output file after the time of this run unless one was given
+args.output_file = args.output_file or f"Test_Cases_{datetime.now().strftime('%d%m%Y%H%M%S')}.xlsx"
+
 # Validate output file extension
 if not args.output_file.lower().endswith(".xlsx"):
     print("❌ Error: Output file must have a .xlsx extension.")
@@ -46,6 +78,75 @@ HEADERS = [
     "Test Script (Step-by-Step) - Test Data", "Test Script (Step-by-Step) - Expected Result", "Coverage (Issues)", "Status"
 ]
 
+# Columns read from the user stories input file
+USER_STORY_COLUMNS = ["User Story ID", "User Story"]
+
+# Columns merged vertically across the steps of a test case
+MERGE_COLS = ["Name", "Objective", "Precondition", "Coverage (Issues)", "Status"]
+MERGE_COL_INDICES = [HEADERS.index(col) for col in MERGE_COLS]
+
+# Maximum number of Gemini requests in flight at once (keeps a run below the 2000 RPM
+# paid-tier limit even at ~1s per request; 429s beyond that are retried with backoff)
+MAX_CONCURRENCY = 30
+
+# Maximum number of user stories scheduled ahead of the one being written, bounding memory use
+MAX_PENDING = 2 * MAX_CONCURRENCY
+
+# Gemini model and lifetime of the cached static prompt prefix
+GEMINI_MODEL = "models/gemini-2.0-flash-001"
+PROMPT_CACHE_TTL = timedelta(minutes=10)
+
+# Gemini rejects cached content below a minimum token count; the prefix size is
+# estimated at ~4 characters per token to skip cache creation when it cannot succeed
+PROMPT_CACHE_MIN_TOKENS = 4096
+CHARS_PER_TOKEN = 4
+
+# Structure of the test cases Gemini is asked to return (keys contain spaces, hence the functional form)
+TestStep = TypedDict("TestStep", {"Step": str, "Test Data": str, "Expected Result": str})
+TestCase = TypedDict("TestCase", {
+    "Title": str,
+    "Objective": str,
+    "Precondition": str,
+    "Test steps": list[TestStep],
+    "Coverage": str,
+    "Status": str,
+})
+
+# Force Gemini to reply with JSON matching the test case structure
+GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": list[TestCase],
+}
+
+# Static instructions placed first in every prompt; the user story always comes last
+PROMPT_INSTRUCTIONS = (
+    "Generate detailed test cases for the user story at the end of this prompt. "
+    "Number each step (e.g. '1. Enter valid username and password') and set Status to 'Draft'. "
+    "Use the additional system context only as an aid for writing the steps, not as full test cases."
+)
+
+# Cached static prompt prefix shared by all requests (None if caching is unavailable)
+prompt_cache = None
+prompt_cache_refreshed_at = 0.0
+
+# Model shared by all requests; replaced by one bound to the prompt cache once it is created
+gemini_model = genai.GenerativeModel(GEMINI_MODEL, generation_config=GENERATION_CONFIG)
+
+# Local cache of Gemini responses keyed by model, schema and prompt, reused across runs (None if disabled)
+RESPONSE_CACHE_FILE = ".gemini_cache.db"
+response_cache = None
+
+# Errors returned once the cached prompt prefix has expired or been removed
+PROMPT_CACHE_ERRORS = (google_exceptions.NotFound, google_exceptions.PermissionDenied)
+
+# Transient API errors worth retrying (429 rate limit, 5xx, timeouts)
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+
 # Function to read additional info from the text file
 def read_system_info(system_info_file):
     """ Reads system context from a text file. """
@@ -57,62 +158,129 @@ def read_system_info(system_info_file):
             print(f"❌ Error reading system information file: {e}")
     return "No additional system context provided."
 
+# Function to call Gemini, retrying with exponential backoff on rate limits and transient errors
+@retry(
+    retry=retry_if_exception_type(RETRYABLE_ERRORS),
+    wait=wait_exponential(multiplier=1, min=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
+async def call_gemini(model, prompt):
+    return await model.generate_content_async(prompt)
+
+# Function to build the part of the prompt that is identical for every user story
+def build_prompt_prefix(system_info):
+    return f"{PROMPT_INSTRUCTIONS}\nAdditional System Context:\n{system_info}\n"
+
+# Function to upload the static prompt prefix to Gemini's context cache once per run
+def init_prompt_cache(prompt_prefix):
+    """
+    Creates a CachedContent holding the static prompt prefix so each request
+    only sends the user story. Falls back to sending the full prompt if the
+    prefix is below the model's minimum cache size or the cache cannot be created.
+    """
+    global prompt_cache, prompt_cache_refreshed_at, gemini_model
+    if len(prompt_prefix) / CHARS_PER_TOKEN < PROMPT_CACHE_MIN_TOKENS:
+        return  # Too small to cache; the full prompt is sent for each user story
+
+    try:
+        cache = caching.CachedContent.create(
+            model=GEMINI_MODEL, contents=[prompt_prefix], ttl=PROMPT_CACHE_TTL
+        )
+        gemini_model = genai.GenerativeModel.from_cached_content(
+            cached_content=cache, generation_config=GENERATION_CONFIG
+        )
+        prompt_cache = cache
+        prompt_cache_refreshed_at = time.monotonic()
+    except Exception as e:
+        print(f"⚠️ Prompt caching unavailable, sending the full prompt for each user story: {e}")
+
+# Function to stop using the prompt cache once it has expired or cannot be refreshed
+def disable_prompt_cache():
+    global prompt_cache, gemini_model
+    if prompt_cache is not None:
+        print("⚠️ Prompt cache is no longer available, sending the full prompt for each remaining user story.")
+        prompt_cache = None
+        gemini_model = genai.GenerativeModel(GEMINI_MODEL, generation_config=GENERATION_CONFIG)
+
+# Function to keep the prompt cache alive for runs that last longer than its TTL
+def refresh_prompt_cache():
+    """ Extends the prompt cache TTL once half of it has elapsed. """
+    global prompt_cache_refreshed_at
+    if prompt_cache is None:
+        return
+    if time.monotonic() - prompt_cache_refreshed_at < PROMPT_CACHE_TTL.total_seconds() / 2:
+        return
+
+    try:
+        prompt_cache.update(ttl=PROMPT_CACHE_TTL)
+        prompt_cache_refreshed_at = time.monotonic()
+    except Exception as e:
+        print(f"⚠️ Failed to refresh prompt cache: {e}")
+        disable_prompt_cache()
+
+# Function to build the response cache key for a user story
+def response_cache_key(prompt_prefix, user_story):
+    """
+    Hashes everything that shapes a response: the model, the response schema
+    fields, the prompt prefix and the user story, so changing any of them
+    requests a fresh response instead of replaying a stale one.
+    """
+    schema_fields = f"{list(TestCase.__annotations__)}{list(TestStep.__annotations__)}"
+    key_source = "||".join([GEMINI_MODEL, schema_fields, prompt_prefix, user_story])
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
 # Function to generate test cases using Gemini API
-def generate_test_cases(user_story, system_info):
-    prompt = f"""Generate detailed test cases for the following user story:
-{user_story}
-Please return the output in **strict JSON format**, with no extra text, using the structure below:
-Output the test cases in the following structured format:
-
-{{
-    'Title': 'Verify Login Functionality',
-    'Objective': 'Verify that a user can log in with valid credentials',
-    'Precondition': 'User must be registered and have valid credentials',
-    'Test steps': [
-        {{
-            'Step': '1. Enter valid username and password',
-            'Test Data': 'Username: testuser, Password: testpass',
-            'Expected Result': 'User is logged in successfully'
-        }},
-        {{
-            'Step': '2. Enter invalid username and password',
-            'Test Data': 'Username: invaliduser, Password: invalidpass',
-            'Expected Result': 'Error message is displayed'
-        }}
-    ],
-    'Coverage': 'Requirement ID: LOGIN-001',
-    'Status': 'Draft'
-}}
-Ensure that the response is **valid JSON**, without any markdown formatting, explanations, or additional text.
-Use the following additional information as an aid to write the steps in the test cases and not the full test cases. 
-Additional System Context:
-{system_info}"""
+async def generate_test_cases(user_story_id, user_story, prompt_prefix):
+    """
+    Generates test cases for a single user story.
+    Returns a tuple (User Story ID, response text or None).
+    """
+    refresh_prompt_cache()
+
+    # Take the model and prompt together, as another request may disable the cache meanwhile
+    model, use_cache = gemini_model, prompt_cache is not None
+    story_prompt = f"User Story:\n{user_story}"
+    prompt = story_prompt if use_cache else prompt_prefix + story_prompt
 
     try:
-        response = genai.GenerativeModel("gemini-2.0-flash-001").generate_content(prompt)
-        return response.text if response else None
+        try:
+            response = await call_gemini(model, prompt)
+        except PROMPT_CACHE_ERRORS:
+            if not use_cache:
+                raise
+            # The cached prefix expired or was removed; resend with the full prompt
+            disable_prompt_cache()
+            response = await call_gemini(gemini_model, prompt_prefix + story_prompt)
+        return user_story_id, response.text if response else None
     except Exception as e:
-        print(f"❌ API Error: {e}")
-        return None
+        print(f"❌ API Error for {user_story_id}: {e}")
+        return user_story_id, None
 
 # Function to transform test case data into a structured list
 def parse_test_cases(response_text, user_story_id):
     """
     Parses the JSON response from Gemini and extracts test cases.
     Handles both a list of test cases and a single test case.
+    Returns one row (a list of values in HEADERS order) per test step.
     """
     if not response_text:
-        print("❌ No response received from Gemini.")
+        print(f"⚠️ No response received from Gemini for {user_story_id}.")
         return []
 
-    # Remove Markdown-style code blocks if they exist
-    response_text = re.sub(r"```(?:json)?\n(.*?)\n```", r"\1", response_text, flags=re.S).strip()
-
     try:
-        response_json = json.loads(response_text)  # Convert string to JSON
-    except json.JSONDecodeError:
-        print("❌ Failed to parse JSON response. Raw response:\n", response_text)
-        return []
+        response_json = json_parser.loads(response_text)  # Convert string to JSON
+    except ValueError:  # json.JSONDecodeError and orjson.JSONDecodeError are both ValueErrors
+        response_json = None
+        if repair_json is not None:
+            try:
+                response_json = json_parser.loads(repair_json(response_text))
+                print(f"⚠️ Repaired malformed JSON response for {user_story_id}.")
+            except ValueError:
+                pass
+        if response_json is None:
+            print("❌ Failed to parse JSON response. Raw response:\n", response_text)
+            return []
 
     test_cases = []
 
@@ -125,6 +293,11 @@ def parse_test_cases(response_text, user_story_id):
         return []
 
     for case in response_json:
+        # Repaired (or unexpected) JSON may not have the expected shape; skip what can't be read
+        if not isinstance(case, dict):
+            print(f"⚠️ Skipping malformed test case for {user_story_id}:", case)
+            continue
+
         title = case.get("Title", "N/A")
         objective = case.get("Objective", "N/A")
         precondition = case.get("Precondition", "N/A")
@@ -132,90 +305,193 @@ def parse_test_cases(response_text, user_story_id):
         status = case.get("Status", "Draft")
 
         steps = case.get("Test steps", [])
-        first_step = True
-
-        for step in steps:
-            test_cases.append({
-                "Name": title if first_step else "",
-                "Objective": objective if first_step else "",
-                "Precondition": precondition if first_step else "",
-                "Test Script (Step-by-Step) - Step": step.get("Step", "N/A"),
-                "Test Script (Step-by-Step) - Test Data": step.get("Test Data", "N/A"),
-                "Test Script (Step-by-Step) - Expected Result": step.get("Expected Result", "N/A"),
-                "Coverage (Issues)": coverage if first_step else "",
-                "Status": status if first_step else ""
-            })
-            first_step = False  # Ensure only the first step gets the merged columns
+        if not isinstance(steps, list):
+            print(f"⚠️ Skipping test case '{title}' for {user_story_id}: unexpected test steps:", steps)
+            continue
+
+        valid_steps = [step for step in steps if isinstance(step, dict)]
+        if len(valid_steps) < len(steps):
+            print(f"⚠️ Skipping {len(steps) - len(valid_steps)} malformed step(s) in test case '{title}' for {user_story_id}.")
+        steps = valid_steps
+
+        rows = [None] * len(steps)  # One preallocated row per step
+
+        for i, step in enumerate(steps):
+            first_step = i == 0  # Ensure only the first step gets the merged columns
+            rows[i] = [
+                title if first_step else "",
+                objective if first_step else "",
+                precondition if first_step else "",
+                step.get("Step", "N/A"),
+                step.get("Test Data", "N/A"),
+                step.get("Expected Result", "N/A"),
+                coverage if first_step else "",
+                status if first_step else ""
+            ]
+
+        test_cases.extend(rows)
 
     return test_cases
 
-# Function to save test cases to an Excel file
-def save_to_excel(test_cases):
-    if not test_cases:
-        print("⚠️ No test cases generated. Excel file was not created.")
-        return
+# Function to write test cases to an Excel file as they are generated
+async def stream_to_excel(test_case_batches):
+    """
+    Writes batches of test case rows (one batch per user story) to the output
+    workbook with xlsxwriter as they arrive, so generated rows are not kept around.
+    By default the shared columns of a test case are merged across its steps;
+    with --no-merge they are repeated on every step row instead, which lets the
+    workbook be written in constant memory mode.
+    """
+    workbook = None
+    row_num = 1  # Next worksheet row (row 0 is headers)
+
+    completed = False
 
-    df = pd.DataFrame(test_cases, columns=HEADERS)
-    
-    with pd.ExcelWriter(OUTPUT_FILE, engine="xlsxwriter") as writer:
-        df.to_excel(writer, sheet_name="Test Cases", index=False)
-        workbook = writer.book
-        worksheet = writer.sheets["Test Cases"]
-        
-        # Adjust column widths for better readability
-        for col_num, col_name in enumerate(HEADERS):
-            worksheet.set_column(col_num, col_num, max(15, len(col_name) + 5))
-        
-        # Merge cells for columns: Title, Objective, Precondition, Coverage, Status
-        merge_format = workbook.add_format({'align': 'center', 'valign': 'vcenter', 'border': 0, 'text_wrap': True})
-        row = 1  # Start from row 1 (since row 0 is headers)
-        while row < len(df):
-            start_row = row
-
-            # Identify the range for merging by finding consecutive empty title rows
-            while row < len(df) and df.loc[row, "Name"] == "":
-                row += 1
-
-            if row - start_row > 1:  # Merge if there are multiple steps
-                for col in ["Name", "Objective", "Precondition", "Coverage (Issues)", "Status"]:
-                    col_idx = df.columns.get_loc(col)
-                    value = df.at[start_row, col]
-                    worksheet.merge_range(start_row + 1, col_idx, row, col_idx, value, merge_format)
-
-            row += 1  # Move to the next test case
-    
-    print(f"✅ Test cases saved to {OUTPUT_FILE}")
+    try:
+        async for rows in test_case_batches:
+            if not rows:
+                continue
+
+            if workbook is None:
+                # Merging cells across rows needs random access to the sheet, so constant memory
+                # mode (which flushes each row once the next one is written) is only used without it
+                workbook = xlsxwriter.Workbook(OUTPUT_FILE, {"constant_memory": args.no_merge})
+                worksheet = workbook.add_worksheet("Test Cases")
+                header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+                merge_format = workbook.add_format({'align': 'center', 'valign': 'vcenter', 'border': 0, 'text_wrap': True})
+
+                # Adjust column widths for better readability
+                for col_num, col_name in enumerate(HEADERS):
+                    worksheet.set_column(col_num, col_num, max(15, len(col_name) + 5))
+
+                worksheet.write_row(0, 0, HEADERS, header_format)
+
+            if args.no_merge:
+                # Repeat the shared columns of each test case on all of its step rows
+                current = rows[0]
+                for offset, row in enumerate(rows):
+                    if row[0] != "":
+                        current = row
+                    else:
+                        for col_idx in MERGE_COL_INDICES:
+                            row[col_idx] = current[col_idx]
+                    worksheet.write_row(row_num + offset, 0, row)
+            else:
+                for offset, row in enumerate(rows):
+                    worksheet.write_row(row_num + offset, 0, row)
+
+                # Merge cells for columns: Title, Objective, Precondition, Coverage, Status
+                # Each test case starts at a row with a non-empty Name and runs until the next one
+                starts = [offset for offset, row in enumerate(rows) if row[0] != ""]
+                for start_row, end_row in zip(starts, starts[1:] + [len(rows)]):
+                    if end_row - start_row < 2:
+                        continue  # Merge only if there are multiple steps
+                    values = rows[start_row]
+                    first_row, last_row = row_num + start_row, row_num + end_row - 1
+                    for col_idx in MERGE_COL_INDICES:
+                        worksheet.merge_range(first_row, col_idx, last_row, col_idx, values[col_idx], merge_format)
+
+            row_num += len(rows)
+        completed = True
+    finally:
+        # xlsxwriter only writes the file on close, so close it even if the run fails part-way
+        if workbook is not None:
+            workbook.close()
+            if completed:
+                print(f"✅ Test cases saved to {OUTPUT_FILE}")
+            else:
+                print(f"⚠️ Run stopped early; test cases generated so far were saved to {OUTPUT_FILE}")
+
+    if workbook is None:
+        print("⚠️ No test cases generated. Excel file was not created.")
 
 def read_user_stories():
 
     """
-    Reads user stories from an Excel file.
-    Extracts 'User Story ID' and 'User Story' columns.
-    Returns a list of tuples (User Story ID, User Story text).
+    Reads user stories from an Excel file one row at a time.
+    Extracts 'User Story ID' and 'User Story' columns from the first sheet.
+    Yields tuples (User Story ID, User Story text).
     """
     if not os.path.exists(INPUT_FILE):
         print(f"⚠️ Input file '{INPUT_FILE}' not found.")
-        return []
+        return
 
     try:
-        df = pd.read_excel(INPUT_FILE, dtype=str)  # Read the Excel file as text
+        # Read-only mode streams rows from the file instead of loading the whole workbook
+        workbook = openpyxl.load_workbook(INPUT_FILE, read_only=True, data_only=True)
     except Exception as e:
         print(f"❌ Error reading the Excel file: {e}")
-        return []
+        return
 
-    # Validate required columns exist
-    required_columns = {"User Story ID", "User Story"}
-    if not required_columns.issubset(df.columns):
-        print(f"❌ Error: Input file must have the columns: {required_columns}")
-        return []
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+
+        # Validate required columns exist
+        required_columns = set(USER_STORY_COLUMNS)
+        if not required_columns.issubset(header):
+            print(f"❌ Error: Input file must have the columns: {required_columns}")
+            return
+
+        id_idx, story_idx = (header.index(col) for col in USER_STORY_COLUMNS)
+        for row in rows:
+            user_story_id = row[id_idx] if id_idx < len(row) else None
+            story_text = row[story_idx] if story_idx < len(row) else None
+            if user_story_id is None and story_text is None:
+                continue  # Skip blank rows
+
+            # Read values as text
+            yield (
+                "" if user_story_id is None else str(user_story_id),
+                "" if story_text is None else str(story_text),
+            )
+    finally:
+        workbook.close()
+
+# Function to generate test cases in user story order with a bounded number of pending requests
+async def generate_test_case_rows(user_stories, prompt_prefix):
+    """
+    Sends user stories to Gemini as they are read, with at most MAX_CONCURRENCY
+    requests in flight and MAX_PENDING scheduled, and yields the parsed test
+    case rows of each user story in the original story order.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+
+    # Parse each response as soon as it arrives, while other requests are still in flight
+    async def fetch_and_parse(user_story_id, story_text):
+        # Reuse the response from a previous run when it still parses into test cases
+        key = None
+        if response_cache is not None:
+            key = response_cache_key(prompt_prefix, story_text)
+            cached = response_cache.get(key)
+            if cached is not None:
+                print(f"♻️ Using cached response for: {user_story_id}")
+                test_cases = parse_test_cases(cached, user_story_id)
+                if test_cases:
+                    return test_cases
+
+        async with semaphore:
+            print(f"\n🔹 Generating test cases for: {user_story_id}\n")
+            user_story_id, response = await generate_test_cases(user_story_id, story_text, prompt_prefix)
+        #print("\nResponse from Gemini:\n", response)
+        test_cases = parse_test_cases(response, user_story_id)
+
+        # Only cache responses that produced test cases, so failures are retried on the next run
+        if key is not None and test_cases:
+            response_cache[key] = response
+        return test_cases
 
-    # Convert DataFrame to list of tuples
-    user_stories = list(df[["User Story ID", "User Story"]].itertuples(index=False, name=None))
+    pending = deque()
+    for user_story_id, story_text in user_stories:
+        pending.append(asyncio.create_task(fetch_and_parse(user_story_id, story_text)))
+        if len(pending) >= MAX_PENDING:
+            yield await pending.popleft()
 
-    return user_stories
+    while pending:
+        yield await pending.popleft()
 
 # Main function
-def main():
+async def main():
     if not os.path.exists(INPUT_FILE):
         print(f"⚠️ Input file '{INPUT_FILE}' not found.")
         return
@@ -223,26 +499,32 @@ def main():
 #    with open(INPUT_FILE, "r", encoding="utf-8") as file:
 #        user_stories = file.readlines()
 
-    all_test_cases = []
     user_stories = read_user_stories()
     system_info = read_system_info(args.system_info_file)
+    prompt_prefix = build_prompt_prefix(system_info)
+    init_prompt_cache(prompt_prefix)
 
-    for user_story_id, story_text in user_stories:
-        print(f"\n🔹 Generating test cases for: {user_story_id}\n")
-        response = generate_test_cases(story_text, system_info)
-        #print("\nResponse from Gemini:\n", response)
-
-        if not response:
-            print("⚠️ No response received from Gemini.")
-            continue
-
-        test_cases = parse_test_cases(response, user_story_id)
-        #print("\nParsed Test Cases:\n", test_cases)
-
-        all_test_cases.extend(test_cases)
+    global response_cache
+    if not args.no_cache:
+        try:
+            response_cache = shelve.open(RESPONSE_CACHE_FILE)
+        except Exception as e:
+            print(f"⚠️ Response cache unavailable, calling Gemini for every user story: {e}")
 
-    save_to_excel(all_test_cases)
+    try:
+        # Read, generate, parse and write one user story at a time instead of
+        # holding all stories, responses and test cases in memory at once
+        await stream_to_excel(generate_test_case_rows(user_stories, prompt_prefix))
+    finally:
+        if response_cache is not None:
+            response_cache.close()
+
+        if prompt_cache:
+            try:
+                prompt_cache.delete()
+            except Exception as e:
+                print(f"⚠️ Failed to delete prompt cache: {e}")
 
 # Run the script
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())